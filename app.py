@@ -1,8 +1,20 @@
+import contextlib
+import math
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from html import escape
+
 import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+import pyarrow as pa
+import duckdb
+
+from kernels import summarize_status
 
 # ------------------------
 # PAGE CONFIG
@@ -34,154 +46,341 @@ csv_files = {
 # ------------------------
 # LOAD CSV WITH CACHE
 # ------------------------
-@st.cache_data
-def load_csv(file_path):
+DATE_KEYWORDS = ('date', 'start', 'end', 'created', 'due')
+
+def text_columns(df):
+    # Arrow-backed strings are not matched by select_dtypes(include='object')
+    return [c for c, t in df.dtypes.items() if isinstance(t, pd.CategoricalDtype) or pd.api.types.is_string_dtype(t)]
+
+def to_categories(df):
+    # Low-cardinality text compares, isin and groups on integer codes
+    for col in text_columns(df):
+        if df[col].nunique(dropna=True) / max(len(df), 1) < 0.5:
+            df[col] = df[col].astype('category')
+    return df
+
+def downcast_numeric(df):
+    # Halve the width of Arrow numeric columns whose values fit; sums still accumulate in 64 bits
+    for col, dtype in df.dtypes.items():
+        if not isinstance(dtype, pd.ArrowDtype):
+            continue
+        if pa.types.is_int64(dtype.pyarrow_dtype):
+            low, high = df[col].min(), df[col].max()
+            if not pd.isna(low) and np.iinfo(np.int32).min <= low and high <= np.iinfo(np.int32).max:
+                df[col] = df[col].astype(pd.ArrowDtype(pa.int32()))
+        elif pa.types.is_float64(dtype.pyarrow_dtype):
+            # Only when every value survives the float32 round trip unchanged
+            narrowed = df[col].astype(pd.ArrowDtype(pa.float32()))
+            if narrowed.astype(dtype).equals(df[col]):
+                df[col] = narrowed
+    return df
+
+def read_parquet_sidecar(file_path):
+    # A Parquet sidecar newer than the CSV is the durable, typed cache across sessions
+    parquet_path = file_path + ".parquet"
     try:
-        df = pd.read_csv(file_path)
-        df.columns = [c.strip() for c in df.columns]
-        # Convert dates
-        for col in df.columns:
-            if any(x in col.lower() for x in ['date', 'start', 'end', 'created', 'due']):
-                df[col] = pd.to_datetime(df[col], errors='coerce')
-        return df
+        if os.path.getmtime(parquet_path) >= os.path.getmtime(file_path):
+            return pd.read_parquet(parquet_path, dtype_backend='pyarrow')
+    except Exception:
+        # Missing or unreadable sidecar: fall back to parsing the CSV
+        pass
+    return None
+
+def write_parquet_sidecar(df, file_path):
+    # Write to a temp file and rename, so readers never see a partial sidecar
+    directory, name = os.path.split(file_path)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=directory or ".", prefix=name + ".", suffix=".tmp.parquet")
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            df.to_parquet(tmp)
+        os.replace(tmp_path, file_path + ".parquet")
+    except Exception:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+
+def parse_csv(file_path):
+    # Detect date columns from the header so they are parsed during the read
+    header = pd.read_csv(file_path, nrows=0).columns
+    date_cols = [c for c in header if any(x in c.strip().lower() for x in DATE_KEYWORDS)]
+    df = pd.read_csv(file_path, parse_dates=date_cols, engine='pyarrow', dtype_backend='pyarrow')
+    df.columns = [c.strip() for c in df.columns]
+    # Columns read_csv could not parse stay as strings; coerce those as before, keeping the
+    # Arrow dtype the Parquet sidecar will read back so both load paths share one schema
+    for col in df.columns:
+        if any(x in col.lower() for x in DATE_KEYWORDS) and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors='coerce').astype(pd.ArrowDtype(pa.timestamp('ns')))
+    return df
+
+def keep_undated_text(df):
+    # The pyarrow engine infers dates for any ISO-looking column; only DATE_KEYWORDS columns should be dates
+    for col, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.ArrowDtype) and pa.types.is_temporal(dtype.pyarrow_dtype) \
+                and not any(x in col.lower() for x in DATE_KEYWORDS):
+            df[col] = df[col].astype(pd.ArrowDtype(pa.string()))
+    return df
+
+# Each CSV rewrite adds a new mtime key; bound the cache so old frames are evicted
+@st.cache_data(show_spinner=False, max_entries=2 * len(csv_files))
+def _load_csv(file_path, mtime):
+    try:
+        df = read_parquet_sidecar(file_path)
+        if df is None:
+            df = parse_csv(file_path)
+            write_parquet_sidecar(df, file_path)
+        return downcast_numeric(to_categories(keep_undated_text(df)))
     except:
         return pd.DataFrame()
 
+def file_mtime(file_path):
+    try:
+        return os.path.getmtime(file_path)
+    except OSError:
+        return None
+
+def load_csv(file_path, mtime=None):
+    # The file's mtime is part of the cache key, so edits on disk invalidate the cached frame
+    if mtime is None:
+        mtime = file_mtime(file_path)
+    if mtime is None:
+        return pd.DataFrame()
+    return _load_csv(file_path, mtime)
+
 # ------------------------
 # SIDEBAR NAVIGATION
 # ------------------------
+def warm_csv(file_path):
+    # Populate the load_csv cache only; keeping the frame on the Future would pin a stale copy
+    load_csv(file_path)
+
+@st.cache_resource(show_spinner=False)
+def preload_csvs():
+    # Parse every module once per server process, in parallel, while the first page renders
+    pool = ThreadPoolExecutor(max_workers=4)
+    return {name: pool.submit(warm_csv, path) for name, path in csv_files.items()}
+
+csv_futures = preload_csvs()
 selected_csv = st.sidebar.selectbox("Select CSV / Module", list(csv_files.keys()))
-df = load_csv(csv_files[selected_csv])
+csv_futures[selected_csv].result()
+# Streamlit hashes only a sample of large frames, so cached helpers below also take this
+# (path, mtime) token to tell an edited CSV apart from the one they were computed on
+data_version = (csv_files[selected_csv], file_mtime(csv_files[selected_csv]))
+df = load_csv(*data_version)
 st.subheader(f"{selected_csv} ({df.shape[0]} rows)")
 
 # ------------------------
 # FILTERS
 # ------------------------
-def render_filters(df):
-    filters = {}
-    for col in df.select_dtypes(include=['object', 'category']).columns:
-        unique_vals = df[col].dropna().unique()
-        if len(unique_vals) > 1 and len(unique_vals) <= 50:
-            selected = st.sidebar.multiselect(f"Filter {col}", unique_vals, default=unique_vals)
-            filters[col] = selected
-    filtered_df = df.copy()
+@st.cache_data
+def filterable_columns(df, version):
+    return {c: list(df[c].dropna().unique()) for c in text_columns(df) if 1 < df[c].nunique(dropna=True) <= 50}
+
+ROW_POSITION = "__row_position__"
+
+# Reused by every filter combination on the same CSV version; the frame itself is not hashed
+@st.cache_resource(max_entries=2 * len(csv_files))
+def to_arrow_table(_df, version, columns):
+    # Only filterable columns plus row positions, which let results be taken from the original frame
+    table = pa.Table.from_pandas(_df[list(columns)], preserve_index=False)
+    return table.append_column(ROW_POSITION, pa.array(np.arange(len(_df), dtype=np.int64)))
+
+def quote_ident(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+@st.cache_data
+def apply_filters(df, version, filters):
+    if not filters:
+        return df
+    # One columnar pass over an Arrow view of the frame instead of a copy per filter;
+    # only matching positions come back, so dtypes, categories and index are unchanged
+    clauses, params = [], []
     for col, vals in filters.items():
-        filtered_df = filtered_df[filtered_df[col].isin(vals)]
-    return filtered_df
+        if vals:
+            clauses.append(f"{quote_ident(col)} IN ({', '.join('?' * len(vals))})")
+            params.extend(vals)
+        else:
+            clauses.append("FALSE")
+    con = duckdb.connect()
+    try:
+        con.register("t", to_arrow_table(df, version, tuple(filterable_columns(df, version))))
+        query = f"SELECT {ROW_POSITION} FROM t WHERE {' AND '.join(clauses)} ORDER BY {ROW_POSITION}"
+        positions = con.execute(query, params).fetchnumpy()[ROW_POSITION]
+        return df.iloc[np.asarray(positions, dtype=np.int64)]
+    finally:
+        con.close()
 
-df_filtered = render_filters(df)
+def render_filters(df, version):
+    filters = {}
+    for col, unique_vals in filterable_columns(df, version).items():
+        selected = st.sidebar.multiselect(f"Filter {col}", unique_vals, default=unique_vals)
+        # A selection covering every value does not narrow the data
+        if set(selected) != set(unique_vals):
+            filters[col] = list(selected)
+    if not filters:
+        return df, filters
+    return apply_filters(df, version, filters), filters
+
+df_filtered, active_filters = render_filters(df, data_version)
+view_version = (data_version, tuple((col, tuple(vals)) for col, vals in active_filters.items()))
 
 # ------------------------
 # SUMMARY METRICS
 # ------------------------
-def render_metrics(df, module_name):
+def status_summary(df, statuses, value_col):
+    n = len(df)
+    cset = frozenset(df.columns)
+    if 'Status' in cset:
+        status = df['Status']
+        if isinstance(status.dtype, pd.CategoricalDtype):
+            codes, categories = status.cat.codes.to_numpy(np.int64), status.cat.categories
+        else:
+            codes, categories = pd.factorize(status)
+            codes, categories = codes.astype(np.int64), pd.Index(categories)
+        match_table = np.zeros(len(categories) + 1, dtype=np.bool_)
+        match_table[:len(categories)] = categories.isin(statuses)
+    else:
+        codes, match_table = np.full(n, -1, dtype=np.int64), np.zeros(1, dtype=np.bool_)
+    if value_col in cset:
+        values = df[value_col].to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        values = np.full(n, np.nan)
+    return summarize_status(codes, match_table, values)
+
+@st.cache_data
+def compute_metrics(df, version, module_name, today):
+    cset = frozenset(df.columns)
     if module_name == "Sales Tracking":
-        total_deals = len(df)
-        won_deals = len(df[df['Status'] == 'Closed Won']) if 'Status' in df.columns else 0
-        revenue = df['Deal Value'].sum() if 'Deal Value' in df.columns else 0
-        st.metric("Total Deals", total_deals)
-        st.metric("Closed Won Deals", won_deals)
-        st.metric("Total Revenue", f"${revenue:,.0f}")
+        total_deals, won_deals, revenue, _ = status_summary(df, ['Closed Won'], 'Deal Value')
+        return {"Total Deals": total_deals, "Closed Won Deals": won_deals, "Total Revenue": f"${revenue:,.0f}"}
     elif module_name == "Products":
-        total_products = len(df)
-        active_users = df['Active Users'].sum() if 'Active Users' in df.columns else 0
-        mrr = df['Monthly Recurring Revenue'].sum() if 'Monthly Recurring Revenue' in df.columns else 0
-        st.metric("Total Products", total_products)
-        st.metric("Active Users", active_users)
-        st.metric("Monthly Revenue", f"${mrr:,.0f}")
+        active_users = df['Active Users'].sum() if 'Active Users' in cset else 0
+        mrr = df['Monthly Recurring Revenue'].sum() if 'Monthly Recurring Revenue' in cset else 0
+        return {"Total Products": len(df), "Active Users": active_users, "Monthly Revenue": f"${mrr:,.0f}"}
     elif module_name == "Support & Tickets":
-        total_tickets = len(df)
-        open_tickets = len(df[df['Status'].isin(['Open','In Progress'])]) if 'Status' in df.columns else 0
-        avg_satisfaction = df['Customer Satisfaction'].mean() if 'Customer Satisfaction' in df.columns else 0
-        st.metric("Total Tickets", total_tickets)
-        st.metric("Open Tickets", open_tickets)
-        st.metric("Avg Customer Satisfaction", f"{avg_satisfaction:.1f}/5")
+        total_tickets, open_tickets, satisfaction_sum, rated = status_summary(df, ['Open', 'In Progress'], 'Customer Satisfaction')
+        avg_satisfaction = satisfaction_sum / rated if rated else 0
+        return {"Total Tickets": total_tickets, "Open Tickets": open_tickets, "Avg Customer Satisfaction": f"{avg_satisfaction:.1f}/5"}
     elif module_name == "Project Management":
-        total_projects = len(df)
-        in_progress = len(df[df['Status'] == 'In Progress']) if 'Status' in df.columns else 0
-        total_budget = df['Budget'].sum() if 'Budget' in df.columns else 0
-        st.metric("Total Projects", total_projects)
-        st.metric("In Progress", in_progress)
-        st.metric("Total Budget", f"${total_budget:,.0f}")
+        total_projects, in_progress, total_budget, _ = status_summary(df, ['In Progress'], 'Budget')
+        return {"Total Projects": total_projects, "In Progress": in_progress, "Total Budget": f"${total_budget:,.0f}"}
     elif module_name == "Team Management":
-        total_team = len(df)
-        avg_salary = df['Salary'].mean() if 'Salary' in df.columns else 0
-        avg_perf = df['Performance Score'].mean() if 'Performance Score' in df.columns else 0
-        st.metric("Total Employees", total_team)
-        st.metric("Average Salary", f"${avg_salary:,.0f}")
-        st.metric("Average Performance", f"{avg_perf:.1f}/5")
+        avg_salary = df['Salary'].mean() if 'Salary' in cset else 0
+        avg_perf = df['Performance Score'].mean() if 'Performance Score' in cset else 0
+        return {"Total Employees": len(df), "Average Salary": f"${avg_salary:,.0f}", "Average Performance": f"{avg_perf:.1f}/5"}
     elif module_name == "Invoices":
-        total_invoices = len(df)
-        total_paid = len(df[df['Status']=='Paid']) if 'Status' in df.columns else 0
-        total_amount = df['Price'].sum() if 'Price' in df.columns else 0
-        st.metric("Total Invoices", total_invoices)
-        st.metric("Paid", total_paid)
-        st.metric("Total Amount", f"${total_amount:,.0f}")
+        total_invoices, total_paid, total_amount, _ = status_summary(df, ['Paid'], 'Price')
+        return {"Total Invoices": total_invoices, "Paid": total_paid, "Total Amount": f"${total_amount:,.0f}"}
     elif module_name == "Subscriptions":
-        total_subs = len(df)
-        active_subs = len(df[df['Status']=='Active']) if 'Status' in df.columns else 0
-        total_revenue = df['Price'].sum() if 'Price' in df.columns else 0
-        st.metric("Total Subscriptions", total_subs)
-        st.metric("Active", active_subs)
-        st.metric("Total Revenue", f"${total_revenue:,.0f}")
+        total_subs, active_subs, total_revenue, _ = status_summary(df, ['Active'], 'Price')
+        return {"Total Subscriptions": total_subs, "Active": active_subs, "Total Revenue": f"${total_revenue:,.0f}"}
     elif module_name == "Follow-Ups":
-        total_followups = len(df)
-        upcoming = len(df[df['Next Follow-Up Date'] >= pd.Timestamp.today()]) if 'Next Follow-Up Date' in df.columns else 0
-        st.metric("Total Follow-Ups", total_followups)
-        st.metric("Upcoming Follow-Ups", upcoming)
+        upcoming = int((df['Next Follow-Up Date'].to_numpy(dtype='datetime64[ns]', na_value=np.datetime64('NaT')) >= np.datetime64(today)).sum()) if 'Next Follow-Up Date' in cset else 0
+        return {"Total Follow-Ups": len(df), "Upcoming Follow-Ups": upcoming}
+    return {}
+
+def render_metrics(df, version, module_name):
+    # Today's date is part of the cache key so date-relative metrics roll over at midnight
+    metrics = compute_metrics(df, version, module_name, date.today())
+    if not metrics:
+        return
+    cols = st.columns(len(metrics))
+    for col, (label, value) in zip(cols, metrics.items()):
+        col.metric(label, value)
 
-render_metrics(df_filtered, selected_csv)
+render_metrics(df_filtered, view_version, selected_csv)
 
 # ------------------------
 # CHARTS
 # ------------------------
-def render_charts(df, module_name):
-    if module_name == "Sales Tracking" and 'Deal Value' in df.columns:
-        fig = px.bar(df, x='Sales Rep', y='Deal Value', color='Status', title='Deal Value by Sales Rep')
-        st.plotly_chart(fig, use_container_width=True)
-    if module_name == "Products" and 'Monthly Recurring Revenue' in df.columns:
-        fig = px.pie(df, names='Product Name', values='Monthly Recurring Revenue', title='MRR by Product')
-        st.plotly_chart(fig, use_container_width=True)
+# Above this many rows figures are built with graph_objects, skipping plotly.express preprocessing
+PX_ROW_LIMIT = 1000
+
+def labels_of(series):
+    return series.to_numpy(dtype=object, na_value=None)
+
+def go_bar(df, x, y, color, title):
+    fig = go.Figure(layout=dict(title=title, barmode='relative', xaxis_title=x, yaxis_title=y, legend_title=color))
+    for name, group in df.groupby(color, observed=True, sort=False):
+        fig.add_trace(go.Bar(x=labels_of(group[x]), y=group[y].to_numpy(dtype=float, na_value=np.nan), name=str(name)))
+    return fig
+
+def go_histogram(df, x, color, title, barmode='relative'):
+    fig = go.Figure(layout=dict(title=title, barmode=barmode, xaxis_title=x, legend_title=color))
+    for name, group in df.groupby(color, observed=True, sort=False):
+        fig.add_trace(go.Histogram(x=labels_of(group[x]), name=str(name)))
+    return fig
+
+def go_pie(df, names, values, title):
+    pie = go.Pie(labels=labels_of(df[names]), values=df[values].to_numpy(dtype=float, na_value=np.nan))
+    return go.Figure(pie, layout=dict(title=title))
+
+@st.cache_data
+def build_figure(df, version, module_name, today):
+    cset = frozenset(df.columns)
+    large = len(df) > PX_ROW_LIMIT
+    bar = go_bar if large else px.bar
+    histogram = go_histogram if large else px.histogram
+    pie = go_pie if large else px.pie
+    if module_name == "Sales Tracking" and 'Deal Value' in cset:
+        return bar(df, x='Sales Rep', y='Deal Value', color='Status', title='Deal Value by Sales Rep')
+    if module_name == "Products" and 'Monthly Recurring Revenue' in cset:
+        return pie(df, names='Product Name', values='Monthly Recurring Revenue', title='MRR by Product')
     if module_name == "Support & Tickets":
-        fig = px.histogram(df, x='Priority', color='Status', barmode='group', title='Tickets by Priority & Status')
-        st.plotly_chart(fig, use_container_width=True)
+        return histogram(df, x='Priority', color='Status', barmode='group', title='Tickets by Priority & Status')
     if module_name == "Project Management":
-        fig = px.bar(df, x='Project Name', y='Budget', color='Status', title='Project Budgets by Status')
-        st.plotly_chart(fig, use_container_width=True)
+        return bar(df, x='Project Name', y='Budget', color='Status', title='Project Budgets by Status')
     if module_name == "Team Management":
-        fig = px.bar(df, x='Full Name', y='Salary', color='Department', title='Team Salaries by Department')
-        st.plotly_chart(fig, use_container_width=True)
+        return bar(df, x='Full Name', y='Salary', color='Department', title='Team Salaries by Department')
     if module_name == "Invoices":
-        fig = px.bar(df, x='Customer', y='Price', color='Status', title='Invoices by Customer & Status')
-        st.plotly_chart(fig, use_container_width=True)
+        return bar(df, x='Customer', y='Price', color='Status', title='Invoices by Customer & Status')
     if module_name == "Subscriptions":
-        fig = px.pie(df, names='Product', values='Price', title='Revenue by Subscription')
-        st.plotly_chart(fig, use_container_width=True)
-    if module_name == "Follow-Ups" and 'Next Follow-Up Date' in df.columns:
-        df['Next Follow-Up Date'] = pd.to_datetime(df['Next Follow-Up Date'], errors='coerce')
-        fig = px.timeline(df, x_start=pd.Timestamp.today(), x_end='Next Follow-Up Date', y='Client Name', color='Status', title='Upcoming Follow-Ups Timeline')
+        return pie(df, names='Product', values='Price', title='Revenue by Subscription')
+    if module_name == "Follow-Ups" and 'Next Follow-Up Date' in cset:
+        return px.timeline(df, x_start=pd.Timestamp(today), x_end='Next Follow-Up Date', y='Client Name', color='Status', title='Upcoming Follow-Ups Timeline')
+    return None
+
+def render_charts(df, version, module_name):
+    fig = build_figure(df, version, module_name, date.today())
+    if fig is not None:
         st.plotly_chart(fig, use_container_width=True)
 
-render_charts(df_filtered, selected_csv)
+render_charts(df_filtered, view_version, selected_csv)
 
 # ------------------------
 # CARD DISPLAY FUNCTION
 # ------------------------
 def render_cards(dataframe, max_cols=3):
-    for idx in range(0, len(dataframe), max_cols):
-        cols = st.columns(max_cols)
-        for col, (_, row) in zip(cols, dataframe.iloc[idx:idx+max_cols].iterrows()):
-            with col:
-                st.markdown("<div class='data-card'>", unsafe_allow_html=True)
-                # Card title
-                title_col = next((c for c in ['Client Name', 'Project Name', 'Full Name', 'Product Name'] if c in dataframe.columns), None)
-                if title_col:
-                    st.markdown(f"<div class='card-title'>{row[title_col]}</div>", unsafe_allow_html=True)
-                for c in dataframe.columns:
-                    value = row[c]
-                    if pd.isnull(value):
-                        value = "-"
-                    st.markdown(f"<div class='card-field'><span class='field-label'>{c}:</span> <span class='field-value'>{value}</span></div>", unsafe_allow_html=True)
-                st.markdown("</div>", unsafe_allow_html=True)
-
-render_cards(df_filtered)
+    columns = list(dataframe.columns)
+    cset = frozenset(columns)
+    arrays = {c: dataframe[c].to_numpy() for c in columns}
+    nulls = {c: pd.isnull(arrays[c]) for c in columns}
+    n = len(dataframe)
+    # Card title
+    title_col = next((c for c in ['Client Name', 'Project Name', 'Full Name', 'Product Name'] if c in cset), None)
+    rows = []
+    for idx in range(0, n, max_cols):
+        cards = []
+        for k in range(min(max_cols, n - idx)):
+            i = idx + k
+            row_values = ['-' if nulls[c][i] else escape(str(arrays[c][i])) for c in columns]
+            title = f"<div class='card-title'>{escape(str(arrays[title_col][i]))}</div>" if title_col else ""
+            fields = "".join(
+                f"<div class='card-field'><span class='field-label'>{escape(str(c))}:</span> <span class='field-value'>{value}</span></div>"
+                for c, value in zip(columns, row_values)
+            )
+            cards.append(f"<div class='data-card' style='flex:1 1 0;min-width:0'>{title}{fields}</div>")
+        # Pad the last row so every card keeps the same width
+        cards += ["<div style='flex:1 1 0'></div>"] * (max_cols - len(cards))
+        rows.append("<div style='display:flex;gap:1rem'>" + "".join(cards) + "</div>")
+    st.markdown("".join(rows), unsafe_allow_html=True)
+
+CARDS_PER_PAGE = 50
+
+page_count = max(1, math.ceil(len(df_filtered) / CARDS_PER_PAGE))
+page = st.sidebar.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+if len(df_filtered) > CARDS_PER_PAGE * 20:
+    st.warning(f"{len(df_filtered)} rows match; use the sidebar filters to narrow them down.")
+st.caption(f"Page {page} of {page_count}")
+render_cards(df_filtered.iloc[(page - 1) * CARDS_PER_PAGE: page * CARDS_PER_PAGE])
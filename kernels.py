@@ -0,0 +1,21 @@
+from numba import njit
+
+
+# Compiled once per process on import; Streamlit reruns of app.py reuse the same dispatcher
+@njit(cache=True)
+def summarize_status(status_codes, match_table, values):
+    # One pass over the status codes and value column: row count, matching statuses, non-null sum and count
+    total = 0
+    matched = 0
+    value_sum = 0.0
+    value_count = 0
+    for i in range(len(status_codes)):
+        total += 1
+        code = status_codes[i]
+        if code >= 0 and match_table[code]:
+            matched += 1
+        value = values[i]
+        if value == value:
+            value_sum += value
+            value_count += 1
+    return total, matched, value_sum, value_count